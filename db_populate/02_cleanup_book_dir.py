@@ -1,12 +1,70 @@
 #! /usr/bin/env python3
 import argparse
+import ctypes
+import errno
 import os
-import re
+from collections import Counter
 from sys import stderr
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
+# renameat2() arguments, see man 2 rename
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
 
-def rename_audio_files(directory_path: str, dry_run: bool) -> None:
+
+def _load_renameat2():
+    """Return libc's renameat2(), or None where it is not available (non-Linux, glibc < 2.28)."""
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError, TypeError):
+        return None
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+
+_renameat2 = _load_renameat2()
+
+
+def _rename_no_replace(src: str, dst: str) -> None:
+    """
+    Rename src to dst, raising FileExistsError if dst already exists.
+
+    With renameat2(RENAME_NOREPLACE) the existence check and the rename are a single
+    atomic system call. Elsewhere, or on filesystems that don't support the flag,
+    fall back to checking first and then calling os.rename.
+    """
+    if _renameat2 is not None:
+        if _renameat2(_AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dst), _RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(err, os.strerror(err), src, None, dst)
+    if os.path.exists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst)
+
+
+def _parse_track_number(name: str) -> Optional[int]:
+    """
+    Return the integer in a <something><digits>.mp3 name (extension case insensitive), or None.
+
+    A plain scan from the end of the name - this runs once per directory entry, and doesn't
+    need the regex engine.
+    """
+    end = len(name) - 4
+    if end < 1 or name[end:].lower() != '.mp3':
+        return None
+    start = end
+    # isdecimal() rather than isdigit(): superscripts and the like are digits, but int() rejects them
+    while start > 0 and name[start - 1].isdecimal():
+        start -= 1
+    if start == end:
+        return None
+    return int(name[start:end])
+
+
+def rename_audio_files(directory_path: str, dry_run: bool) -> List[str]:
     """
     Rename audio files in a directory to a standardized format with zero-padded integers.
 
@@ -21,6 +79,11 @@ def rename_audio_files(directory_path: str, dry_run: bool) -> None:
         directory_path (str): Path to the directory containing the audio files
         dry_run (bool): If True, only print what would be renamed without actually renaming
 
+    Returns:
+        List[str]: The sorted final names of all .mp3 files in the directory, renamed or not,
+            so that later steps don't have to scan the directory again (on a dry run, the
+            names they would get)
+
     Raises:
         FileNotFoundError: If the directory doesn't exist
         ValueError: If no files matching the expected pattern are found
@@ -39,20 +102,21 @@ def rename_audio_files(directory_path: str, dry_run: bool) -> None:
     if not os.path.isdir(directory_path):
         raise ValueError(f"Path is not a directory: {directory_path}")
 
-    # Pattern to match files: <something><digits>.mp3 (case insensitive)
-    pattern = re.compile(r'^(.*?)(\d+)\.mp3$', re.IGNORECASE)
-
     # Find all matching files and extract their integers
     matching_files: List[Tuple[str, int, str]] = []  # (filename, integer, full_path)
+    mp3_names = set()  # every .mp3 file, including those without a number in the name
 
     try:
-        for filename in os.listdir(directory_path):
-            full_path = os.path.join(directory_path, filename)
-            if os.path.isfile(full_path):
-                match = pattern.match(filename)
-                if match:
-                    integer_part = int(match.group(2))
-                    matching_files.append((filename, integer_part, full_path))
+        # scandir gets the file type from the directory listing itself, no stat() per entry
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith('.mp3'):
+                    mp3_names.add(entry.name)
+                integer_part = _parse_track_number(entry.name)
+                if integer_part is not None:
+                    matching_files.append((entry.name, integer_part, entry.path))
     except OSError as e:
         raise OSError(f"Error reading directory {directory_path}: {e}")
 
@@ -63,32 +127,47 @@ def rename_audio_files(directory_path: str, dry_run: bool) -> None:
     # Find the maximum integer to determine padding
     max_integer = max(file_info[1] for file_info in matching_files)
     max_digits = len(str(max_integer))
+    name_format = "%%0%dd.mp3" % max_digits  # e.g. "%03d.mp3"
 
-    # Process each file
+    # Plan all renames first, so that name collisions are reported before any file is touched
+    plan: List[Tuple[str, str, str]] = []  # (filename, full_path, new_name)
     for old_filename, integer_part, full_path in matching_files:
         # **FIXED LOGIC: Pad all numbers except the maximum, but only if there are numbers
         # smaller by at least one order of magnitude**
 
-        new_name =  f"{integer_part:0{max_digits}d}.mp3"
+        new_name = name_format % integer_part
         # Skip if the name wouldn't change
         if old_filename == new_name:
             print(f"The name '{old_filename}' is ok. Moving on.")
             continue
-
+        plan.append((old_filename, full_path, new_name))
+
+    # A new name is the canonical name for its integer, so it can only collide with a file that
+    # keeps its name or with another file carrying the same integer - never with a file that is
+    # itself about to be renamed. The plan therefore needs no ordering or temporary names.
+    renamed = {old_filename for old_filename, _, _ in plan}
+    kept = {old_filename for old_filename, _, _ in matching_files} - renamed
+    target_counts = Counter(new_name for _, _, new_name in plan)
+    for old_filename, _, new_name in plan:
+        if new_name in kept or target_counts[new_name] > 1:
+            raise OSError(f"Failed to rename {old_filename} to {new_name}: Target file already exists: {new_name}")
+
+    for old_filename, full_path, new_name in plan:
         new_full_path = os.path.join(directory_path, new_name)
 
         if dry_run:
             print(f"Will rename {old_filename} {new_name}")
         else:
             try:
-                # Check if target file already exists
-                if os.path.exists(new_full_path) and new_full_path != full_path:
-                    raise OSError(f"Target file already exists: {new_name}")
-
-                os.rename(full_path, new_full_path)
+                # Fails if the target exists, without a separate (racy) existence check
+                _rename_no_replace(full_path, new_full_path)
             except OSError as e:
                 raise OSError(f"Failed to rename {old_filename} to {new_name}: {e}")
 
+    final_names = mp3_names - renamed
+    final_names.update(new_name for _, _, new_name in plan)
+    return sorted(final_names)
+
 
 def main():
     """
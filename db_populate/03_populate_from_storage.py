@@ -1,19 +1,24 @@
 #! /usr/bin/env python3
 import argparse
+import importlib
 import os
+import shlex
 import subprocess
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 from peewee import SqliteDatabase, DatabaseError, Proxy
 
 from models import Book, Chapter
-from utils import check_adb_device, is_valid_sqlite_db, validate_mp3_files, calculate_md5, get_mp3_duration_in_ms
+from utils import AdbShell, check_adb_device, is_valid_sqlite_db, validate_mp3_files
+from utils import get_mp3_duration_in_ms, get_mp3_duration_in_ms_cached, open_duration_cache, close_duration_cache, DURATION_CACHE_FILE_NAME
+from utils import MD5Cache, MD5_CACHE_FILE_NAME
 
 DB_NAME = 'bookreader.db'
 # Setup global  Peewee database proxy - Peewee is so lame
 # I don't want to instantiate the db here before checking and
 # informing the user that something may be wrong
-from settings import global_db_proxy
+from settings import global_db_proxy, DATABASE_PRAGMAS
 
 
 def parse_directory_name(directory_path: str) -> Tuple[str, str]:
@@ -32,37 +37,52 @@ def parse_directory_name(directory_path: str) -> Tuple[str, str]:
 
 
 
-def create_device_directory(device_name: str,  book_title: str, dry_run: bool = False) -> str:
+def create_device_directory(shell: AdbShell, book_title: str, dry_run: bool = False) -> str:
     """Create a directory on the device for the book."""
     book_dir_name = book_title.replace(' ', '')
     device_path = f"/sdcard/Audiobooks/BookReader/audio/{book_dir_name}"
     if not dry_run:
-        try:
-            subprocess.run(['adb','-s', device_name,  'shell', 'mkdir', '-p', device_path], check=True)
-            print(f"Created directory on device: {device_path}")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to create directory on device {device_name}: {e}")
+        # The session only returns stdout, so fold mkdir's error message into it
+        output, returncode = shell.run(f'mkdir -p {shlex.quote(device_path)} 2>&1')
+        if returncode != 0:
+            print(f"Failed to create directory on device {shell.device_name}: {output}")
             exit(1)
+        print(f"Created directory on device: {device_path}")
     else:
-        print(f"[Dry Run] Would create directory on device {device_name}: {device_path}")
+        print(f"[Dry Run] Would create directory on device {shell.device_name}: {device_path}")
     return device_path
 
 
 
 
-def get_device_md5(device_name: str,  device_path: str) -> str:
-    """Get MD5 checksum of a file on the device using ADB."""
+def get_device_md5_bulk(shell: AdbShell, device_dir: str) -> Dict[str, str]:
+    """Get MD5 checksums of all MP3 files in a device directory with a single shell command.
+
+    Returns a dict mapping file basename to its MD5 checksum; files missing on
+    the device are simply absent from the dict.
+    """
+    device_md5s: Dict[str, str] = {}
     try:
-        result = subprocess.run(['adb', '-s', device_name, 'shell', 'md5sum', device_path], capture_output=True, text=True)
-        if result.returncode == 0 and result.stdout:
-            # md5sum output format: <hash>  <path>
-            parts = result.stdout.strip().split()
-            if len(parts) > 0:
-                return parts[0]
-        return ""
+        output, _ = shell.run(f'md5sum {shlex.quote(device_dir)}/*.mp3 2>/dev/null')
+        # md5sum output format: <hash>  <path>, one line per file
+        for line in output.splitlines():
+            parts = line.strip().split(maxsplit=1)
+            if len(parts) == 2:
+                device_md5s[os.path.basename(parts[1])] = parts[0]
     except Exception as e:
-        print(f"Error calculating MD5 for device file {device_path}: {e}")
-        return ""
+        print(f"Error calculating MD5 for files in device directory {device_dir}: {e}")
+    return device_md5s
+
+
+def get_device_file_sizes(shell: AdbShell, device_dir: str) -> Dict[str, int]:
+    """Get the sizes of all MP3 files in a device directory, as a dict mapping file basename to size in bytes."""
+    device_sizes: Dict[str, int] = {}
+    output, _ = shell.run(f'stat -c "%s %n" {shlex.quote(device_dir)}/*.mp3 2>/dev/null')
+    for line in output.splitlines():
+        parts = line.strip().split(maxsplit=1)
+        if len(parts) == 2 and parts[0].isdigit():
+            device_sizes[os.path.basename(parts[1])] = int(parts[0])
+    return device_sizes
 
 
 def table_exists(db: SqliteDatabase, table_name: str) -> bool:
@@ -75,11 +95,11 @@ def table_exists(db: SqliteDatabase, table_name: str) -> bool:
         return False
 
 
-def store_book_in_db(db: SqliteDatabase, title: str, author: str, dry_run: bool = False) -> int:
-    """Store book details in the database and return the book ID."""
+def store_book_in_db(db: SqliteDatabase, title: str, author: str, dry_run: bool = False) -> Optional[Book]:
+    """Store book details in the database and return the book (None on dry run)."""
     if dry_run:
         print(f"[Dry Run] Would store book in database: {title} by {author}")
-        return -1  # Dummy ID for dry run
+        return None
     else:
         try:
             with db.atomic():
@@ -88,75 +108,139 @@ def store_book_in_db(db: SqliteDatabase, title: str, author: str, dry_run: bool
                     print(f"Stored book in database: {title} by {author} with ID {book.id}")
                 else:
                     print(f"Book already exists in database: {title} by {author} with ID {book.id}")
-                return book.id
+                return book
         except Exception as e:
             print(f"Error storing book in database: {e}")
             raise
 
 
-def store_chapter_in_db(db: SqliteDatabase, book: Book, title: str, file_name: str, play_time: int,
-                        dry_run: bool = False) -> None:
-    """Store chapter details in the database."""
-    if not dry_run:
-        try:
-            with db.atomic():
-                # Check if chapter already exists for this book with the same fileName
-                chapter, created = Chapter.get_or_create(
-                    book=book,
-                    fileName=file_name,
-                    defaults={
-                        'title': title,
-                        'playTime': play_time,
-                        'lastPlayedPosition': 0,
-                        'lastPlayedTimestamp': 0
-                    }
-                )
-                if created:
-                    print(f"Stored chapter in database: {title} ({file_name}) with ID {chapter.id}")
-                else:
+def store_chapters_in_db(db: SqliteDatabase, book: Book, chapters: List[Tuple[str, str, int]],
+                         dry_run: bool = False) -> None:
+    """
+    Store chapter details in the database in a single transaction.
+
+    Each chapter is given as a (title, file_name, play_time) tuple. Chapters already stored for
+    this book under the same fileName only get their playTime updated, if it changed.
+    """
+    if dry_run:
+        for title, file_name, play_time in chapters:
+            print(f"[Dry Run] Would store chapter in database: {title} ({file_name}; "
+                  f"play time {play_time}ms ({play_time/60000:.2f}min))")
+        return
+
+    try:
+        with db.atomic():
+            # There is no unique index on (bookId, fileName) that an upsert could rely on,
+            # so look up all existing chapters of this book with one query
+            existing = {chapter.fileName: chapter for chapter in Chapter.select().where(Chapter.book == book)}
+            new_rows = []
+            for title, file_name, play_time in chapters:
+                chapter = existing.get(file_name)
+                if chapter is None:
+                    new_rows.append((book.id, title, file_name, play_time))
+                    print(f"Storing chapter in database: {title} ({file_name})")
+                elif chapter.playTime != play_time:
                     # Update playTime if chapter already exists
-                    if chapter.playTime != play_time:
-                        print(f"Updated playTime for existing chapter: {title} ({file_name}) with ID {chapter.id} "
-                              f"- old: {chapter.playTime}ms, new: {play_time}ms")
-                        chapter.playTime = play_time
-                        chapter.save()
-                    else:
-                        print(f"Chapter already exists with same playTime ({play_time}ms): {title} ({file_name}) with ID {chapter.id}")
-        except Exception as e:
-            print(f"Error storing chapter in database: {e}")
-            raise
-    else:
-        print(f"[Dry Run] Would store chapter in database: {title} ({file_name}; "
-              f"play time {play_time}ms ({play_time/60000:.2f}min))")
+                    print(f"Updated playTime for existing chapter: {title} ({file_name}) with ID {chapter.id} "
+                          f"- old: {chapter.playTime}ms, new: {play_time}ms")
+                    Chapter.update(playTime=play_time).where(Chapter.id == chapter.id).execute()
+                else:
+                    print(f"Chapter already exists with same playTime ({play_time}ms): {title} ({file_name}) with ID {chapter.id}")
+            if new_rows:
+                # Plain executemany on the connection skips peewee's per-row field conversion;
+                # it binds one row at a time, so there is no limit on the number of variables.
+                # All columns are given: peewee's defaults live in Python, so tables made with
+                # create_tables() have no SQL DEFAULT to fall back on.
+                db.cursor().executemany(
+                    f"INSERT INTO {Chapter._meta.table_name} "
+                    "(bookId, title, fileName, playTime, lastPlayedPosition, lastPlayedTimestamp, finishedPlaying) "
+                    "VALUES (?, ?, ?, ?, 0, 0, 0)",
+                    new_rows)
+        if new_rows:
+            print(f"Stored {len(new_rows)} new chapters in database.")
+    except Exception as e:
+        print(f"Error storing chapters in database: {e}")
+        raise
 
 
-def copy_file_to_device(device_name: str, local_path: str, device_path: str, dry_run: bool = False) -> None:
-    """Copy a file to the device using ADB if MD5 checksums differ."""
-    if not dry_run:
-        # Calculate local MD5
-        local_md5 = calculate_md5(local_path)
-        if not local_md5:
-            print(f"Failed to calculate local MD5 for {local_path}, proceeding with upload.")
-        else:
-            # Get device MD5 (if file exists)
-            device_md5 = get_device_md5(device_name, device_path)
-            if device_md5 and local_md5 == device_md5:
-                print(f"Skipped upload: File {local_path} already exists on device {device_name} with matching MD5 ({local_md5})")
-                return
-            elif device_md5:
-                print(f"MD5 mismatch: Local {local_md5} vs Device {device_md5}, uploading {local_path}")
-            else:
-                print(f"No file or MD5 on device {device_name} for {device_path}, uploading {local_path}")
+def file_needs_upload(device_name: str, local_path: str, device_path: str, local_md5: str,
+                      device_md5s: Dict[str, str]) -> bool:
+    """Check whether a file has to be copied to the device, i.e. whether the MD5 checksums differ.
 
-        # Proceed with upload if MD5 differs or file doesn't exist on device
-        try:
-            subprocess.run(['adb', '-s', device_name, 'push', local_path, device_path], check=True)
-            print(f"Copied file to device: {local_path} -> {device_path}")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to copy file to device {device_name}: {e}")
-            exit(1)
+    local_md5 is the precomputed MD5 of the local file (empty if it could not be calculated);
+    device_md5s maps file basenames to their MD5 on the device, as returned by get_device_md5_bulk.
+    """
+    if not local_md5:
+        print(f"Failed to calculate local MD5 for {local_path}, proceeding with upload.")
+        return True
+
+    # Get device MD5 (if file exists)
+    device_md5 = device_md5s.get(os.path.basename(device_path), "")
+    if device_md5 and local_md5 == device_md5:
+        print(f"Skipped upload: File {local_path} already exists on device {device_name} with matching MD5 ({local_md5})")
+        return False
+    elif device_md5:
+        print(f"MD5 mismatch: Local {local_md5} vs Device {device_md5}, uploading {local_path}")
     else:
-        print(f"[Dry Run] Would copy file to device: {local_path} -> {device_path}")
+        print(f"No file or MD5 on device {device_name} for {device_path}, uploading {local_path}")
+    return True
+
+
+def copy_files_to_device_bulk(device_name: str, local_dir: str, device_dir: str, files: List[str]) -> bool:
+    """
+    Copy files from one local directory to a device directory as a single tar stream.
+
+    The archive is piped through 'adb shell -T' into tar on the device, so the per-file
+    overhead of the adb sync protocol is paid once for the whole batch.
+    Returns False if the transfer failed, e.g. because there is no tar on either side.
+    """
+    try:
+        tar = subprocess.Popen(['tar', '-cf', '-', '-C', local_dir, *files], stdout=subprocess.PIPE)
+    except OSError as e:
+        print(f"Could not run tar locally: {e}")
+        return False
+    try:
+        # Unlike 'adb exec-in', which exits with 0 as soon as it has sent its input, 'adb shell'
+        # (-T: no pty, so the binary stream passes unchanged) returns the exit status of the remote tar
+        untar = subprocess.Popen(['adb', '-s', device_name, 'shell', '-T', f'tar -xf - -C {shlex.quote(device_dir)}'],
+                                 stdin=tar.stdout)
+    except OSError as e:
+        print(f"Could not run adb: {e}")
+        tar.kill()
+        return False
+    finally:
+        # Only the two children hold the pipe now, so tar gets SIGPIPE if adb exits early
+        tar.stdout.close()
+    untar_returncode = untar.wait()
+    tar_returncode = tar.wait()
+    return untar_returncode == 0 and tar_returncode == 0
+
+
+def copy_files_to_device(device_name: str, local_paths: List[str], device_dir: str, dry_run: bool = False) -> None:
+    """Copy files to a device directory, as one tar stream or else with a single ADB push."""
+    if not local_paths:
+        return
+    if dry_run:
+        for local_path in local_paths:
+            print(f"[Dry Run] Would copy file to device: {local_path} -> {device_dir}/")
+        return
+
+    # For one or two files the tar stream gains nothing over adb push
+    local_dirs = {os.path.dirname(local_path) for local_path in local_paths}
+    if len(local_paths) > 2 and len(local_dirs) == 1:
+        files = [os.path.basename(local_path) for local_path in local_paths]
+        if copy_files_to_device_bulk(device_name, local_dirs.pop(), device_dir, files):
+            print(f"Copied {len(local_paths)} files to device: {device_dir}")
+            return
+        print(f"Copying the files to device {device_name} as one tar stream failed, falling back to adb push.")
+
+    try:
+        # adb push takes several sources and transfers them all over one connection
+        subprocess.run(['adb', '-s', device_name, 'push', *local_paths, device_dir + '/'], check=True)
+        print(f"Copied {len(local_paths)} files to device: {device_dir}")
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to copy files to device {device_name}: {e}")
+        exit(1)
 
 
 def main():
@@ -166,6 +250,8 @@ def main():
     helpstr = "The name of the device on which to operate. See 'shell> adb devices' if unsure."
     parser.add_argument('device', type=str, help=helpstr)
     parser.add_argument('--dry-run', action='store_true', help="Simulate actions without executing them")
+    parser.add_argument('--rename', action='store_true',
+                        help="First rename the MP3 files to zero-padded numbers, as 02_cleanup_book_dir.py does")
     args = parser.parse_args()
 
     directory_path = os.path.abspath(args.directory)
@@ -188,25 +274,42 @@ def main():
     print(f"Database '{DB_NAME}' ok.")
 
     db = None
+    shell = None
     try:
         # Parse book title and author from directory name
         book_title, author_name = parse_directory_name(directory_path)
 
-        # Validate MP3 files
-        mp3_files = validate_mp3_files(directory_path)
+        # Rename the files first if asked to, and reuse the resulting file list instead of
+        # listing the directory again (on a dry run, the new names don't exist yet)
+        mp3_names = None
+        if args.rename:
+            cleanup = importlib.import_module('02_cleanup_book_dir')
+            renamed = cleanup.rename_audio_files(directory_path, dry_run)
+            mp3_names = renamed if not dry_run else None
+
+        # The MD5 and duration caches are kept next to the database; a dry run writes neither
+        # (the MD5 cache only saves what changed, and a dry run hashes nothing)
+        cache_dir = os.path.dirname(os.path.abspath(DB_NAME))
+        md5_cache = MD5Cache(os.path.join(cache_dir, MD5_CACHE_FILE_NAME))
+        if not dry_run:
+            open_duration_cache(os.path.join(cache_dir, DURATION_CACHE_FILE_NAME))
+
+        # Validate MP3 files; the ones unchanged since they were hashed in an earlier run are not read again
+        mp3_files = validate_mp3_files(directory_path, mp3_names, md5_cache)
         if not mp3_files:
             print("Error: No valid MP3 files found in directory.")
             exit(1)
 
         print(f"found {len(mp3_files)} MP3 files in directory: {directory_path}")
 
-        # Create directory on device
+        # Create directory on device; all shell commands on the device go through one adb session
         print(book_title)
-        device_book_dir = create_device_directory(device_name, book_title, dry_run)
+        shell = AdbShell(device_name)
+        device_book_dir = create_device_directory(shell, book_title, dry_run)
 
         # Connect to database and check tables
         print("Connecting to database...")
-        db = SqliteDatabase(DB_NAME)
+        db = SqliteDatabase(DB_NAME, pragmas=DATABASE_PRAGMAS)
         global_db_proxy.initialize(db)
         db.connect()
 
@@ -218,20 +321,76 @@ def main():
         else:
             print("Database tables already exist. Skipping table creation to avoid new index creation.")
 
-        # Store book in database and get its ID
-        book_id = store_book_in_db(db, book_title, author_name, dry_run)
-        book = Book.get(Book.id == book_id) if not dry_run and book_id != -1 else None
+        # Store book in database
+        book = store_book_in_db(db, book_title, author_name, dry_run)
+
+        # Reuse the MD5s from the previous run for files whose size and mtime haven't changed
+        local_paths = [os.path.join(directory_path, mp3_file) for mp3_file in mp3_files]
+        local_stats = [os.stat(local_path) for local_path in local_paths]
+        cached_entries = [md5_cache.get_entry(path, st) for path, st in zip(local_paths, local_stats)]
+        to_hash = [path for path, entry in zip(local_paths, cached_entries) if entry is None] if not dry_run else []
+
+        # If every file is unchanged since it was last confirmed on this device, trust the cache
+        # and skip hashing the files on the device altogether
+        all_confirmed = all(entry and device_name in entry.get('devices', []) for entry in cached_entries)
+        if all_confirmed and not dry_run:
+            # The device may have been wiped or the book deleted since; a listing of the book
+            # directory is cheap, and any missing file or different size sends us to the MD5 check
+            device_sizes = get_device_file_sizes(shell, device_book_dir)
+            all_confirmed = all(device_sizes.get(mp3_file) == st.st_size
+                                for mp3_file, st in zip(mp3_files, local_stats))
+            if all_confirmed:
+                print(f"No files changed since the last upload to device {device_name}, skipping device MD5 check.")
+            else:
+                print(f"Files on device {device_name} differ from the last upload, checking device MD5s.")
+
+        # hashlib releases the GIL while hashing, so with one thread per core the local MD5s are
+        # computed in parallel; the header reads and the device md5sum wait on I/O alongside them.
+        # Executor.map submits all tasks up front; the results are collected in file order.
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) + 1) as executor:
+            # The device hashes its copies at the same time, rather than after the local hashing
+            device_md5s_future = None
+            if not dry_run and not all_confirmed:
+                device_md5s_future = executor.submit(get_device_md5_bulk, shell, device_book_dir)
+            md5_results = executor.map(md5_cache.md5, to_hash)
+            get_duration = get_mp3_duration_in_ms if dry_run else get_mp3_duration_in_ms_cached
+            duration_results = executor.map(get_duration, local_paths)
+            new_md5s = dict(zip(to_hash, md5_results))
+            play_times = list(duration_results)
+            if device_md5s_future is not None:
+                device_md5s = device_md5s_future.result()
+            elif dry_run:
+                device_md5s = {}
+            else:
+                device_md5s = {mp3_file: entry['md5'] for mp3_file, entry in zip(mp3_files, cached_entries)}
+        local_md5s = [entry['md5'] if entry else new_md5s.get(path, "") for path, entry in zip(local_paths, cached_entries)]
 
         # Process each MP3 file
-        for mp3_file in mp3_files:
-            local_file_path = os.path.join(directory_path, mp3_file)
+        confirmed_md5s = []
+        chapters = []
+        to_upload = []
+        for mp3_file, local_file_path, st, entry, local_md5, play_time in \
+                zip(mp3_files, local_paths, local_stats, cached_entries, local_md5s, play_times):
             device_file_path = os.path.join(device_book_dir, mp3_file)
             chapter_title = os.path.splitext(mp3_file)[0]
-            play_time = get_mp3_duration_in_ms(local_file_path)
 
-            # Copy file to device (with MD5 check)
-            copy_file_to_device(device_name, local_file_path, device_file_path, dry_run)
-            store_chapter_in_db(db, book, chapter_title, mp3_file, play_time, dry_run)
+            # Collect the files to copy to the device (with MD5 check)
+            if dry_run or file_needs_upload(device_name, local_file_path, device_file_path, local_md5, device_md5s):
+                to_upload.append(local_file_path)
+            chapters.append((chapter_title, mp3_file, play_time))
+
+            # Once the upload is done, the file is on the device with this MD5
+            if local_md5:
+                devices = set(entry['devices']) if entry else set()
+                confirmed_md5s.append((local_file_path, st, local_md5, devices | {device_name}))
+
+        # copy_files_to_device exits on failure, so only files that made it get recorded (the cache
+        # is written out when the script exits), and no chapter is stored without its file
+        copy_files_to_device(device_name, to_upload, device_book_dir, dry_run)
+        if not dry_run:
+            for local_file_path, st, local_md5, devices in confirmed_md5s:
+                md5_cache.put(local_file_path, st, local_md5, devices)
+        store_chapters_in_db(db, book, chapters, dry_run)
 
         # Verify database contents (for debugging)
         if not dry_run:
@@ -240,13 +399,16 @@ def main():
             for book in Book.select():
                 print(f" - Book: {book.title} by {book.author} (ID: {book.id})")
             print(f"Chapters in database: {Chapter.select().count()}")
-            for chapter in Chapter.select():
+            for chapter in Chapter.select(Chapter, Book).join(Book):
                 print(f" - Chapter: {chapter.title} ({chapter.fileName}) for Book ID: {chapter.book.id}")
 
     except Exception as e:
         print(f"Error: {e}")
 
     finally:
+        close_duration_cache()
+        if shell is not None:
+            shell.close()
         if db is not None and not db.is_closed():
             db.close()
             print("Database connection closed.")
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 import os
+import posixpath
+import shlex
+import shutil
 import subprocess
 import tempfile
 import argparse
-from typing import Tuple, Optional, Any
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, Any
 from mutagen.mp3 import MP3
 from mutagen.mp3 import HeaderNotFoundError
 from models import Book, Chapter
@@ -14,34 +19,31 @@ from peewee import (
     Proxy, IntegrityError
 )
 
-from settings import DEVICE_BASE_AUDIO_PATH, DATABASE_PATH, global_db_proxy
+from settings import DEVICE_BASE_AUDIO_PATH, DATABASE_PATH, DATABASE_PRAGMAS, global_db_proxy
 from utils import check_adb_connection, is_valid_sqlite_db, get_mp3_duration_in_ms
+from utils import id3v2_tag_size, vbr_header_duration_in_ms
 
 
 
 # --- Utility Functions ---
 
-def _pull_and_get_duration_in_ms(device_path: str) -> Tuple[Optional[int], Optional[str]]:
+def _pull_and_get_duration_in_ms(device_path: str, local_path: str) -> Tuple[Optional[int], Optional[str]]:
     """
-    Pulls an audio file from an Android device via ADB to a temporary
+    Pulls an audio file from an Android device via ADB to a local scratch
     location, gets its duration, and then cleans up.
 
     Args:
         device_path: The full path to the file on the Android device.
+        local_path: Where to put the pulled file (a path in this run's scratch directory).
 
     Returns:
-        A tuple: (duration_in_seconds, error_message). duration_in_seconds is
+        A tuple: (duration_in_ms, error_message). duration_in_ms is
         None if an error occurred.
     """
-    # Create a unique temporary file path
-    # We use mkstemp to ensure the filename is unique and secure, then close the handle.
-    fd, temp_mp3_path = tempfile.mkstemp(suffix=".mp3")
-    os.close(fd)  # Close the file descriptor, as we only need the path
-
     try:
         # Step 1: Use 'adb pull' to copy the file
         print(f"  -> Pulling '{device_path}'...")
-        pull_command = ['adb', 'pull', device_path, temp_mp3_path]
+        pull_command = ['adb', 'pull', device_path, local_path]
 
         # Run the adb pull command
         subprocess.run(
@@ -52,10 +54,8 @@ def _pull_and_get_duration_in_ms(device_path: str) -> Tuple[Optional[int], Optio
             timeout=30  # Add a timeout for safety
         )
 
-        # Step 2: Use mutagen to get the duration from the local temp file
-        duration_in_ms = get_mp3_duration_in_ms(temp_mp3_path)
-
-        return duration_in_ms, None  # Success
+        # Step 2: Use mutagen to get the duration from the local copy
+        return _get_local_duration_in_ms(local_path)
 
     except subprocess.CalledProcessError as e:
         # This error often means the file was not found on the device
@@ -63,36 +63,195 @@ def _pull_and_get_duration_in_ms(device_path: str) -> Tuple[Optional[int], Optio
         if "does not exist" in error_message:
             return None, f"File not found on device at '{device_path}'."
         return None, f"ADB Error: {error_message}"
+    except Exception as e:
+        return None, f"An unexpected error occurred during processing: {e}"
+    finally:
+        # Step 3: Clean up by deleting the local copy
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+
+def _get_local_duration_in_ms(local_path: str) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Gets the duration of a pulled audio file, as a (duration_in_ms, error_message) tuple.
+    """
+    try:
+        return get_mp3_duration_in_ms(local_path), None
     except HeaderNotFoundError:
         return None, "File is not a valid MP3 file or metadata is corrupt."
     except Exception as e:
         return None, f"An unexpected error occurred during processing: {e}"
-    finally:
-        # Step 3: Clean up by deleting the temporary file
-        if os.path.exists(temp_mp3_path):
-            os.remove(temp_mp3_path)
-            print(f"  -> Cleaned up temporary file: {os.path.basename(temp_mp3_path)}")
 
 
-def process_chapter(chapter: Chapter, is_dry_run: bool) -> None:
+def _pull_book_dir(book_dir: str, scratch_dir: str) -> Optional[str]:
     """
-    Constructs the device path, gets the MP3 duration via ADB, and updates
-    the chapter record in the database.
+    Pulls a whole book directory from the device with a single 'adb pull'.
 
-    Args:
-        chapter: The Chapter model instance to process.
-        is_dry_run: If True, only reports actions without modifying the database.
+    Returns:
+        The local copy of the directory, or None if the pull failed.
     """
-    book_title = chapter.book.title
-    book_dir_name = book_title.replace(' ', '')
+    print(f"  -> Pulling the whole directory '{book_dir}'...")
+    try:
+        subprocess.run(['adb', 'pull', '-a', book_dir, scratch_dir], check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"  -> Pulling '{book_dir}' failed, pulling its files one by one: {e.stderr.strip()}")
+        return None
+    return os.path.join(scratch_dir, posixpath.basename(book_dir))
+
+
+def book_device_dir(book: Book) -> str:
+    """
+    Constructs the path of the directory holding the book's MP3 files on the device.
+    """
+    book_dir_name = book.title.replace(' ', '')
 
-    # Construct the full device path
-    device_path = os.path.join(
+    return os.path.join(
         DEVICE_BASE_AUDIO_PATH,
-        book_dir_name,
-        chapter.fileName
+        book_dir_name
     ).replace('\\', '/')  # Ensure forward slashes for ADB path on all OS
 
+
+def with_device_paths(chapters: Iterable[Chapter]) -> Iterator[Tuple[Chapter, str]]:
+    """
+    Pairs each chapter with the full path of its MP3 file on the device.
+    Each book's directory is worked out only once, for its first chapter.
+    """
+    book_dirs: Dict[int, str] = {}
+    for chapter in chapters:
+        book_dir = book_dirs.get(chapter.book.id)
+        if book_dir is None:
+            book_dir = book_dirs[chapter.book.id] = book_device_dir(chapter.book)
+        yield chapter, f"{book_dir}/{chapter.fileName}"
+
+
+# Bytes per dd block when streaming the start of a file from the device
+_HEADER_BLOCK_SIZE = 65536
+
+
+def _read_device_file_head(device_path: str, blocks: int) -> bytes:
+    """
+    Streams the first `blocks` * 64 KiB of a file on the device over 'adb exec-out',
+    without writing anything to disk. Returns fewer bytes for a shorter (or missing) file.
+    """
+    result = subprocess.run(
+        ['adb', 'exec-out', f'dd if={shlex.quote(device_path)} bs={_HEADER_BLOCK_SIZE} count={blocks} 2>/dev/null'],
+        check=True,
+        capture_output=True,
+        timeout=30
+    )
+    return result.stdout
+
+
+# A book is pulled as a whole directory, with one adb call, instead of file by file, if at least
+# this many of its files, and this share of them, have no Xing/Info or VBRI header
+BULK_PULL_MIN_FILES = 4
+BULK_PULL_MIN_SHARE = 0.5
+
+
+def _read_header_duration_in_ms(device_path: str) -> Optional[int]:
+    """
+    Gets the duration of an audio file on an Android device from the Xing/Info or VBRI header
+    of its first frame, streaming only the start of the file from the device.
+
+    Returns:
+        The duration in milliseconds, or None if the file has no such header
+        (or could not be read).
+    """
+    try:
+        data = _read_device_file_head(device_path, 1)
+        # The first frame comes after the ID3v2 tag, which can be large if it holds cover art
+        audio_start = id3v2_tag_size(data[:10])
+        if len(data) == _HEADER_BLOCK_SIZE and audio_start + 4096 > len(data):
+            data = _read_device_file_head(device_path, (audio_start + 4096) // _HEADER_BLOCK_SIZE + 1)
+        duration_in_ms = vbr_header_duration_in_ms(data[audio_start:audio_start + 4096])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        # Let the full pull report what is wrong with the file
+        return None
+    if duration_in_ms is not None:
+        print(f"  -> Read the duration from the header of '{device_path}'")
+    return duration_in_ms
+
+
+def get_durations_in_ms(device_paths: List[str],
+                        executor: ThreadPoolExecutor) -> List[Tuple[Optional[int], Optional[str]]]:
+    """
+    Gets the durations of audio files on an Android device.
+
+    Most MP3s carry the duration in the Xing/Info or VBRI header of their first frame,
+    so first only the start of each file is streamed from the device. The files
+    without such a header are pulled into a scratch directory and measured in full:
+    a whole book directory with a single adb call if most of the book's files are
+    among them, otherwise file by file. Each pulled copy is deleted once it has been
+    measured, so at most one book directory is on local disk at a time.
+
+    Args:
+        device_paths: The full paths to the files on the Android device.
+        executor: The pool that runs the adb calls.
+
+    Returns:
+        A (duration_in_ms, error_message) tuple for each file, in the order given.
+    """
+    header_durations = list(executor.map(_read_header_duration_in_ms, device_paths))
+    results: List[Tuple[Optional[int], Optional[str]]] = [(duration, None) for duration in header_durations]
+
+    # The files that have to be pulled, by book directory
+    to_pull: Dict[str, List[int]] = {}
+    for i, (device_path, duration) in enumerate(zip(device_paths, header_durations)):
+        if duration is None:
+            to_pull.setdefault(posixpath.dirname(device_path), []).append(i)
+    if not to_pull:
+        return results
+
+    files_per_dir = Counter(posixpath.dirname(device_path) for device_path in device_paths)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        pulls = {}
+        bulk_pulls = []
+        for book_dir, indices in to_pull.items():
+            if len(indices) >= max(BULK_PULL_MIN_FILES, BULK_PULL_MIN_SHARE * files_per_dir[book_dir]):
+                bulk_pulls.append((book_dir, indices))
+            else:
+                for i in indices:
+                    pulls[i] = executor.submit(_pull_and_get_duration_in_ms, device_paths[i],
+                                               os.path.join(scratch_dir, f"{i}.mp3"))
+
+        # The single files are pulled by the pool meanwhile; the books one after the other
+        for book_dir, indices in bulk_pulls:
+            local_dir = _pull_book_dir(book_dir, scratch_dir)
+            measured = {}
+            for i in indices:
+                local_path = os.path.join(local_dir, posixpath.basename(device_paths[i])) if local_dir else None
+                if local_path and os.path.exists(local_path):
+                    measured[i] = executor.submit(_get_local_duration_in_ms, local_path)
+                else:
+                    pulls[i] = executor.submit(_pull_and_get_duration_in_ms, device_paths[i],
+                                               os.path.join(scratch_dir, f"{i}.mp3"))
+            for i, duration in measured.items():
+                results[i] = duration.result()
+            if local_dir:
+                shutil.rmtree(local_dir, ignore_errors=True)
+
+        for i, pull in pulls.items():
+            results[i] = pull.result()
+    return results
+
+
+def process_chapter(chapter: Chapter, device_path: str, is_dry_run: bool,
+                    pull_result: Tuple[Optional[int], Optional[str]] = (None, None)) -> Optional[Tuple[int, int, int]]:
+    """
+    Reports the chapter's MP3 duration, as measured on the device, and works out
+    the update to the chapter record in the database.
+
+    Args:
+        chapter: The Chapter model instance to process.
+        device_path: The full path to the chapter's file on the Android device.
+        is_dry_run: If True, only reports actions without modifying the database.
+        pull_result: The (duration_in_ms, error_message) returned by
+            get_durations_in_ms for the chapter; ignored on a dry run.
+
+    Returns:
+        A (playTime, finishedPlaying, id) tuple for the chapter's UPDATE, or None
+        if there is nothing to update (dry run, or the duration is unknown).
+    """
     print(f"\nProcessing Chapter ID {chapter.id}: '{chapter.title}' ({chapter.fileName})")
 
     if is_dry_run:
@@ -101,18 +260,17 @@ def process_chapter(chapter: Chapter, is_dry_run: bool) -> None:
         print(f"    - Current DB Row: playTime={chapter.playTime}, "
             f"lastPlayedPosition={chapter.lastPlayedPosition}, "
             f"finishedPlaying={chapter.finishedPlaying}")
-        return
+        return None
 
-    # Call the helper to pull and measure the duration
-    duration_in_ms, error = _pull_and_get_duration_in_ms(device_path)
+    duration_in_ms, error = pull_result
 
     if error:
         print(f"  [ERROR] Failed to get duration: {error}")
-        return
+        return None
 
     if duration_in_ms is None:
         print("  [ERROR] Duration could not be calculated.")
-        return
+        return None
 
 
     # Calculate finishedPlaying status
@@ -121,12 +279,6 @@ def process_chapter(chapter: Chapter, is_dry_run: bool) -> None:
             chapter.lastPlayedPosition >= (duration_in_ms * 0.95):
         finished = 1
 
-    # Update the database record
-    Chapter.update(
-        playTime=duration_in_ms,
-        finishedPlaying=finished
-    ).where(Chapter.id == chapter.id).execute()
-
     minutes = duration_in_ms // 60000
     seconds = duration_in_ms % 60000
 
@@ -135,6 +287,8 @@ def process_chapter(chapter: Chapter, is_dry_run: bool) -> None:
         f"and finishedPlaying to {finished} "
         f"(last played: {chapter.lastPlayedPosition}s).")
 
+    return duration_in_ms, finished, chapter.id
+
 
 
 def main() -> None:
@@ -167,7 +321,7 @@ def main() -> None:
         exit(1)
     print(f"Database '{DATABASE_PATH}' ok.")
 
-    db = SqliteDatabase(DATABASE_PATH)
+    db = SqliteDatabase(DATABASE_PATH, pragmas=DATABASE_PRAGMAS)
     global_db_proxy.initialize(db)
 
 
@@ -177,11 +331,34 @@ def main() -> None:
 
         # Iterate over all chapters and pre-fetch the related book to avoid N+1 queries
         # We also need to get the records where playTime is 0 to simulate the initial run
-        chapters_to_process = Chapter.select().join(Book)
-        print(f"\nFound {len(chapters_to_process)} chapters to check/process.")
-
-        for chapter in chapters_to_process:
-            process_chapter(chapter, args.dry_run)
+        # Selecting the Book columns too fills in chapter.book from the same row;
+        # iterator() streams the rows instead of caching them all in the query
+        chapters_to_process = Chapter.select(Chapter, Book).join(Book)
+        print(f"\nFound {chapters_to_process.count()} chapters to check/process.")
+
+        if args.dry_run:
+            for chapter, device_path in with_device_paths(chapters_to_process.iterator()):
+                process_chapter(chapter, device_path, args.dry_run)
+        else:
+            # The adb calls are bound by the USB transfer, so run a few at a time. The results
+            # come back in chapter order, and the database is only written from this thread
+            # (a handful of workers, not one adb process per chapter).
+            chapters = list(with_device_paths(chapters_to_process.iterator()))
+            updates = []
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                pull_results = get_durations_in_ms([device_path for _, device_path in chapters], executor)
+                for (chapter, device_path), pull_result in zip(chapters, pull_results):
+                    update = process_chapter(chapter, device_path, args.dry_run, pull_result)
+                    if update is not None:
+                        updates.append(update)
+
+            # Write all the updates in one transaction, with a single prepared statement
+            if updates:
+                with db.atomic():
+                    db.cursor().executemany(
+                        f"UPDATE {Chapter._meta.table_name} SET playTime = ?, finishedPlaying = ? WHERE id = ?",
+                        updates)
+                print(f"\nUpdated {len(updates)} chapters in the database.")
 
     except Exception as e:
         print(f"\n[CRITICAL ERROR] An error occurred during database operation: {e}")
@@ -4,6 +4,16 @@ from peewee import Proxy
 DATABASE_PATH = 'bookreader.db'
 DEVICE_BASE_AUDIO_PATH = '/sdcard/Audiobooks/BookReader/audio'
 
+# SQLite pragmas for the populate scripts: WAL with synchronous=normal
+# needs no fsync per commit, and the cache/mmap sizes keep the whole db in memory
+DATABASE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,  # negative means KiB, i.e. 64 MB
+    'temp_store': 'memory',
+    'mmap_size': 268435456,  # 256 MB
+}
+
 # Use a global proxy for the database connection
 # This allows models to be defined before the database connection is initialized
 global_db_proxy = Proxy()
@@ -1,24 +1,81 @@
+import atexit
 import hashlib
+import json
+import mmap
 import os
+import re
+import shelve
 import sqlite3
 import subprocess
-from typing import List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from mutagen import MutagenError
 from mutagen.mp3 import MP3
 
 
+# How long the parsed 'adb devices' output is reused, in seconds
+ADB_DEVICES_TTL = 5.0
+
+_adb_devices_cache: Optional[Dict[str, str]] = None
+_adb_devices_time = 0.0
+_adb_server_checked = False
+
+
+def _ensure_adb_server() -> None:
+    """
+    Start the adb server once per process, so that later adb calls talk to a running daemon.
+
+    If the server wasn't running, it is stopped again when the script exits.
+    """
+    global _adb_server_checked
+    if _adb_server_checked:
+        return
+    _adb_server_checked = True
+    result = subprocess.run(['adb', 'start-server'], capture_output=True, text=True, timeout=30)
+    # adb only reports "daemon started successfully" if it had to start the server
+    if 'daemon started successfully' in result.stdout + result.stderr:
+        atexit.register(subprocess.run, ['adb', 'kill-server'], capture_output=True)
+
+
+def _get_adb_devices(ttl: float = ADB_DEVICES_TTL) -> Dict[str, str]:
+    """
+    Return the devices adb knows about as {serial: state}, e.g. {'emulator-5554': 'device'}.
+
+    The parsed 'adb devices' output is reused for ttl seconds. Raises the same exceptions as
+    subprocess.run(..., check=True) if adb can't be run.
+    """
+    global _adb_devices_cache, _adb_devices_time
+    if _adb_devices_cache is not None and time.monotonic() - _adb_devices_time < ttl:
+        return _adb_devices_cache
+
+    _ensure_adb_server()
+    result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, check=True, timeout=5)
+    devices = {}
+    for line in result.stdout.splitlines():
+        # Skip the "List of devices attached" header and any "* daemon ..." notices
+        parts = line.split()
+        if len(parts) >= 2 and not line.startswith(('List of devices', '*')):
+            devices[parts[0]] = parts[1]
+    _adb_devices_cache, _adb_devices_time = devices, time.monotonic()
+    return devices
+
+
 def check_adb_device(device_name) -> bool:
     """Check if an ADB device is available."""
     try:
-        result = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
-        result_lines = result.stdout.splitlines()
-        if len(result_lines) == 0:
+        devices = _get_adb_devices()
+        if len(devices) == 0:
             print("No ADB devices found")
             return False
-        elif len([l for l in result_lines if device_name in l]) == 0:
+        elif device_name not in devices:
             print(f"Device '{device_name}' not found among ADB devices")
             return False
+        elif devices[device_name] != 'device':
+            print(f"Device '{device_name}' is not ready: {devices[device_name]}")
+            return False
     except Exception as e:
         print(f"Error checking ADB devices: {e}")
         return False
@@ -38,14 +95,8 @@ def check_adb_connection() -> Optional[str]:
         subprocess.run(['adb', 'version'], capture_output=True, check=True, timeout=5)
 
         # Check if a device is connected and authorized
-        result = subprocess.run(
-            ['adb', 'devices'],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=5
-        )
-        if "device" not in result.stdout or "unauthorized" in result.stdout:
+        states = _get_adb_devices().values()
+        if 'device' not in states or 'unauthorized' in states:
             return "Error: No authorized Android device found. Check your connection."
 
     except FileNotFoundError:
@@ -60,31 +111,83 @@ def check_adb_connection() -> Optional[str]:
     return None
 
 
+class AdbShell:
+    """
+    A persistent ``adb shell`` session on one device.
+
+    Every ``adb`` invocation spawns a client process and sets up a new transport to the
+    device; commands sent through one session share a single connection. Meant to be used
+    as a context manager:
+
+    >>> with AdbShell('emulator-5554') as shell:
+    ...     output, returncode = shell.run('ls /sdcard')
+    """
+    _SENTINEL = '__ADB_SHELL_DONE__'
+
+    def __init__(self, device_name: str):
+        self.device_name = device_name
+        self._process = subprocess.Popen(['adb', '-s', device_name, 'shell'],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         text=True, encoding='utf-8', errors='replace', bufsize=1)
+
+    def run(self, command: str) -> Tuple[str, int]:
+        """Run a shell command on the device and return its output and exit status."""
+        # The sentinel goes on a line of its own even if the output doesn't end with a newline;
+        # the extra newline this adds is stripped below.
+        self._process.stdin.write(f"{command}\nprintf '\\n{self._SENTINEL} %d\\n' $?\n")
+        self._process.stdin.flush()
+        lines = []
+        for line in self._process.stdout:
+            if line.startswith(self._SENTINEL):
+                output = ''.join(lines)
+                return output[:-1] if output.endswith('\n') else output, int(line.split()[1])
+            lines.append(line)
+        raise RuntimeError(f"adb shell session on device {self.device_name} ended unexpectedly")
+
+    def close(self) -> None:
+        """End the session."""
+        if self._process.poll() is None:
+            try:
+                self._process.stdin.write("exit\n")
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+
+    def __enter__(self) -> 'AdbShell':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
 SQLITE_MAGIC = b"SQLite format 3\0"
 
 
-def is_valid_sqlite_db(path: str, verify_by_connection: bool = True) -> bool:
+def is_valid_sqlite_db(path: str, verify_by_connection: bool = False) -> bool:
     """
     Check whether a file exists at *path* and is a valid SQLite3 database.
 
-    The function performs two checks (in order):
+    The check is done in one of two ways:
 
-    1. **Filesystem check** – the path must exist and point to a regular file.
-    2. **SQLite validation** – either:
-           * a quick header check using the SQLite file signature, or
-           * an actual connection attempt (default).
+    * a quick header check using the SQLite file signature (default) –
+      a single read of the first 16 bytes;
+    * an actual read-only connection attempt followed by a read of the
+      schema version – SQLite itself validates the header and the first
+      page, and fails if the file is missing or not a database.
 
     Parameters
     ----------
     path: str
         Path to the file that should be inspected.
-    verify_by_connection: bool, optional (default=True)
+    verify_by_connection: bool, optional (default=False)
         If ``True`` the function will try to open the file with
-        ``sqlite3.connect()`` (using the ``uri`` parameter).  This is the most
-        reliable way to verify that the file can actually be used as a SQLite
-        database.  If ``False`` only the 16‑byte header check is performed,
-        which is faster but does not guarantee that the file can be opened
-        by SQLite (e.g., it could be corrupted beyond the header).
+        ``sqlite3.connect()`` (using the ``uri`` parameter) and read
+        ``PRAGMA schema_version``.  This is the most reliable way to verify
+        that the file can actually be used as a SQLite database.  If
+        ``False`` only the 16‑byte header check is performed, which does
+        not guarantee that the file can be opened by SQLite (e.g., it
+        could be corrupted beyond the header).
 
     Returns
     -------
@@ -111,24 +214,38 @@ def is_valid_sqlite_db(path: str, verify_by_connection: bool = True) -> bool:
         raise TypeError("path must be a string")
 
     # ------------------------------------------------------------------
-    # 2️⃣  Does the file exist and is it a regular file?
+    # 2️⃣  Full validation via a connection attempt?  A single open does
+    #     the existence, file type and header checks all at once.
     # ------------------------------------------------------------------
-    if not os.path.exists(path):
-        print(f"File '{path}' does not exist")
-        return False
-    if not os.path.isfile(path):
-        print(f"File '{path}' is not a regular file")
-        return False
+    if verify_by_connection:
+        try:
+            # mode=ro: never create the file if it doesn't exist.
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                # Connecting is lazy; this forces SQLite to read the header.
+                conn.execute("PRAGMA schema_version")
+            finally:
+                conn.close()
+        except (sqlite3.DatabaseError, OSError) as e:
+            print(f"Connection with '{path}' could not be established: {e}")
+            return False
+        return True
 
     # ------------------------------------------------------------------
     # 3️⃣  Quick header validation (SQLite files start with this byte
-    #     sequence).  This is optional but cheap and catches many obvious
-    #     non‑SQLite files.
+    #     sequence).
     # ------------------------------------------------------------------
+    if not os.path.isfile(path):
+        print(f"File '{path}' does not exist or is not a regular file")
+        return False
 
     try:
-        with open(path, "rb") as f:
-            header = f.read(16)          # first 16 bytes
+        # One pread of the first 16 bytes, no buffered file object
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            header = os.pread(fd, 16, 0)
+        finally:
+            os.close(fd)
     except OSError as e:
         # Could not read the file (permissions, I/O error, etc.)
         print(f"File '{path}' could not be opened: {e}")
@@ -138,53 +255,70 @@ def is_valid_sqlite_db(path: str, verify_by_connection: bool = True) -> bool:
         print(f"File '{path}' does not appear to be an SQLite3 database")
         return False
 
-    # ------------------------------------------------------------------
-    # 4️⃣  Full validation via a connection attempt?
-    # ------------------------------------------------------------------
-    if verify_by_connection:
-        try:
-            # The `uri=True` flag allows us to open the file even if the
-            # path contains characters that would otherwise be interpreted
-            # as SQLite URI parameters.
-            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
-            # If we got here, SQLite accepted the file.  Close it promptly.
-            conn.close()
-        except (sqlite3.DatabaseError, OSError):
-            print(f"Connection with '{path}' could not be established")
-            return False
-
     # If we reach this point, everything looks good.
     return True
 
 
-def validate_mp3_files(directory_path: str) -> List[str]:
-    """Validate and return list of mp3 files in the directory, checking for true MP3 format."""
-    mp3_files = []
-    for file in os.listdir(directory_path):
-        if not file.endswith('.mp3'):
-            print(f"Warning: Non-MP3 file found: {file}")
-            continue
-        # if not re.match(r'^\d+\.mp3$', file):
-        #     print(f"Warning: MP3 file with invalid naming format: {file}")
-        #     continue
-
-        # Check if it's a true MP3 file by reading the header
-        file_path = os.path.join(directory_path, file)
+def _has_mp3_header(file_path: str) -> bool:
+    """Check whether a file starts like an MP3: an ID3v2 tag or an MPEG frame sync."""
+    # A single pread gets all the bytes needed for either check
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        header = os.pread(fd, 4, 0)
+    finally:
+        os.close(fd)
+    return header[:3] == b'ID3' or (len(header) >= 2 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0)
+
+
+def validate_mp3_files(directory_path: str, names: Optional[Iterable[str]] = None,
+                       md5_cache: Optional['MD5Cache'] = None) -> List[str]:
+    """
+    Validate and return list of mp3 files in the directory, checking for true MP3 format.
+
+    If names is given (e.g. the list returned by rename_audio_files), only those files
+    are checked and the directory is not scanned again.
+    If md5_cache is given, files with an up-to-date entry in it are taken as valid without
+    reading them: only files that passed this check get hashed into the cache.
+    """
+    if names is not None:
+        # the same selection as the scan below
+        candidates = [name for name in names if name.endswith('.mp3') and not name.startswith('.')]
+    else:
+        candidates = []
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                file = entry.name
+                if file.startswith('.') or not entry.is_file():
+                    # hidden files and subdirectories
+                    continue
+                if not file.endswith('.mp3'):
+                    print(f"Warning: Non-MP3 file found: {file}")
+                    continue
+                # if not re.match(r'^\d+\.mp3$', file):
+                #     print(f"Warning: MP3 file with invalid naming format: {file}")
+                #     continue
+                candidates.append(file)
+
+    def check_header(file: str) -> Tuple[bool, Optional[Exception]]:
+        path = os.path.join(directory_path, file)
         try:
-            with open(file_path, 'rb') as f:
-                header = f.read(3)
-                if header.startswith(b'ID3'):
-                    mp3_files.append(file)
-                else:
-                    f.seek(0)
-                    first_two_bytes = f.read(2)
-                    if len(first_two_bytes) == 2 and first_two_bytes[0] == 0xFF and (first_two_bytes[1] & 0xE0) == 0xE0:
-                        mp3_files.append(file)
-                    else:
-                        print(f"Warning: File {file} does not appear to be a valid MP3 (invalid header)")
+            if md5_cache is not None and md5_cache.get_entry(path) is not None:
+                return True, None
+            return _has_mp3_header(path), None
         except Exception as e:
-            print(f"Warning: Could not read file {file} to validate MP3 format: {e}")
-            continue
+            return False, e
+
+    # Check if each file is a true MP3 by reading its header; the reads are pure I/O, so overlap
+    # as many of them as the storage is likely to sustain
+    mp3_files = []
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        for file, (is_mp3, error) in zip(candidates, executor.map(check_header, candidates)):
+            if error is not None:
+                print(f"Warning: Could not read file {file} to validate MP3 format: {error}")
+            elif is_mp3:
+                mp3_files.append(file)
+            else:
+                print(f"Warning: File {file} does not appear to be a valid MP3 (invalid header)")
 
     mp3_files.sort()
     return mp3_files
@@ -192,24 +326,236 @@ def validate_mp3_files(directory_path: str) -> List[str]:
 
 def calculate_md5(file_path: str) -> str:
     """Calculate MD5 checksum of a local file."""
-    hash_md5 = hashlib.md5()
     try:
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        # Unbuffered: file_digest and readinto fill their own buffers straight from the file,
+        # without a copy through a BufferedReader
+        with open(file_path, 'rb', buffering=0) as f:
+            if hasattr(hashlib, 'file_digest'):
+                # Python 3.11+: the read/update loop runs in C, in 256 KiB blocks
+                return hashlib.file_digest(f, 'md5').hexdigest()
+            # Older Pythons: hash a memory map of the file in a single call (mmap can't map empty files)
+            if os.fstat(f.fileno()).st_size == 0:
+                return hashlib.md5().hexdigest()
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.md5(mm).hexdigest()
+            except (OSError, ValueError, OverflowError):
+                # The file doesn't fit in the address space (32-bit) or can't be mapped at all:
+                # read it in 1 MiB pieces into one reused buffer instead
+                hash_md5 = hashlib.md5()
+                buffer = bytearray(1 << 20)
+                view = memoryview(buffer)
+                f.seek(0)
+                while n := f.readinto(buffer):
+                    hash_md5.update(view[:n])
+                return hash_md5.hexdigest()
     except Exception as e:
         print(f"Error calculating MD5 for local file {file_path}: {e}")
         return ""
 
 
+MD5_CACHE_FILE_NAME = '.md5cache.json'
+
+
+class MD5Cache:
+    """
+    MD5s of local files, kept across runs in a JSON file (by default next to the database).
+
+    The cache maps each file's absolute path to a dict with the file's ``size``, ``mtimeNs``
+    and ``md5`` at the time it was hashed, and the list of ``devices`` the file was last
+    confirmed to be on with that MD5. An entry only counts while the file's size and mtime
+    still match it. A missing or unreadable cache file is treated as empty.
+    Changes are written back once, when the process exits.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self._entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable MD5 cache {cache_path}: {e}")
+        atexit.register(self.save)
+
+    def get_entry(self, path: str, st: Optional[os.stat_result] = None) -> Optional[dict]:
+        """Return the entry for path if the file's size and mtime still match it, None otherwise."""
+        if st is None:
+            st = os.stat(path)
+        entry = self._entries.get(os.path.abspath(path))
+        if isinstance(entry, dict) and entry.get('md5') \
+                and entry.get('size') == st.st_size and entry.get('mtimeNs') == st.st_mtime_ns:
+            return entry
+        return None
+
+    def put(self, path: str, st: os.stat_result, md5: str, devices: Iterable[str] = ()) -> None:
+        """Record the MD5 of path as of the given stat, and the devices it is known to be on."""
+        self._entries[os.path.abspath(path)] = {'size': st.st_size, 'mtimeNs': st.st_mtime_ns, 'md5': md5,
+                                                'devices': sorted(set(devices))}
+        self._dirty = True
+
+    def md5(self, path: str) -> str:
+        """Return the MD5 of a local file, hashing it only if it changed since it was cached."""
+        st = os.stat(path)
+        entry = self.get_entry(path, st)
+        if entry is not None:
+            return entry['md5']
+        md5 = calculate_md5(path)
+        if md5:
+            self.put(path, st, md5)
+        return md5
+
+    def save(self) -> None:
+        """Write the cache file, if anything changed since it was loaded."""
+        if not self._dirty:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Warning: Could not write MD5 cache {self.cache_path}: {e}")
+
+
+# MPEG audio frame header fields, see http://www.mp3-tech.org/programmer/frame_header.html
+# Sample rates by version bits (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1) and sample rate index
+_MPEG_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+# mutagen reads the version as: leading 'LAME' letters stripped, one digit, any dots, the minor digits
+_LAME_VERSION_RE = re.compile(rb'[EMAL]*(\d)\.*(\d+)')
+
+
+def id3v2_tag_size(header: bytes) -> int:
+    """Return the size in bytes of the ID3v2 tag at the start of header (0 if there is none)."""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = (header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | (header[9] & 0x7F)
+    footer_size = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer_size
+
+
+def vbr_header_duration_in_ms(data: bytes) -> Optional[int]:
+    """
+    Get the duration of an MP3 from the Xing/Info or VBRI header in its first frame.
+
+    Both VBR (Xing) and CBR (Info) files written by LAME and most other encoders, and VBR
+    files from Fraunhofer encoders (VBRI), carry the number of frames in that header, so the
+    duration follows without scanning the file. The result matches what mutagen reports,
+    including the LAME encoder delay/padding correction.
+
+    Parameters:
+        data (bytes): The audio data from the first frame on, i.e. with any ID3v2 tag
+            skipped. A few KiB are enough.
+
+    Returns:
+        Optional[int]: The duration in milliseconds, or None if there is no Xing/Info
+            or VBRI header with a frame count.
+    """
+    # Find the first MPEG frame header
+    pos = data.find(b'\xff')
+    while 0 <= pos <= len(data) - 4:
+        b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+        version, layer = (b1 >> 3) & 3, (b1 >> 1) & 3
+        bitrate_index, sample_rate_index = b2 >> 4, (b2 >> 2) & 3
+        if (b1 & 0xE0) == 0xE0 and version != 1 and layer != 0 and bitrate_index != 15 and sample_rate_index != 3:
+            break
+        pos = data.find(b'\xff', pos + 1)
+    else:
+        return None
+
+    # Xing headers are only written in Layer III streams, right after the side information
+    if layer != 1:
+        return None
+    mono = (b3 >> 6) == 3
+    if version == 3:
+        side_info_size, samples_per_frame = (17 if mono else 32), 1152
+    else:
+        side_info_size, samples_per_frame = (9 if mono else 17), 576
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    offset = pos + 4 + side_info_size
+    if data[offset:offset + 4] not in (b'Xing', b'Info'):
+        return _vbri_duration_in_ms(data, pos + 36, samples_per_frame, sample_rate)
+    if len(data) < offset + 12:
+        return None
+    flags = int.from_bytes(data[offset + 4:offset + 8], 'big')
+    if not flags & 0x1:
+        return None
+    frames = int.from_bytes(data[offset + 8:offset + 12], 'big')
+    samples = frames * samples_per_frame
+
+    # The LAME tag follows the optional Xing fields (frames, bytes, TOC, quality);
+    # from LAME 3.90 on it holds the encoder delay and padding, in samples
+    lame_offset = offset + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0) \
+        + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+    samples -= _lame_encoder_delay_and_padding(data[lame_offset:lame_offset + 36])
+
+    return int(float(max(samples, 0)) / sample_rate * 1000)
+
+
+def _lame_encoder_delay_and_padding(lame_tag: bytes) -> int:
+    """
+    The encoder delay plus padding, in samples, from the LAME tag at the start of lame_tag,
+    or 0 if there is no LAME tag that carries them. Accepts exactly the tags mutagen does.
+    """
+    # A 20 byte version field, of which the extended header takes the last 11; the extended
+    # header is 27 bytes long, with the delay and padding (12 bits each) in bytes 12-14
+    if len(lame_tag) < 36 or not lame_tag.startswith((b'LAME', b'L3.99')):
+        return 0
+    match = _LAME_VERSION_RE.match(lame_tag, 0, 20)
+    if not match:
+        return 0
+    version, rest = (int(match.group(1)), int(match.group(2))), lame_tag[match.end():20]
+    # Before 3.90 (and in some 3.90 alphas) there is no extended header
+    if version < (3, 90) or (version == (3, 90) and rest[-11:-10] == b'(') or len(rest) < 11:
+        return 0
+    # Only revision 0 of the extended header is known
+    if lame_tag[9] >> 4 != 0:
+        return 0
+    delay_and_padding = int.from_bytes(lame_tag[21:24], 'big')
+    return (delay_and_padding >> 12) + (delay_and_padding & 0xFFF)
+
+
+def _vbri_duration_in_ms(data: bytes, offset: int, samples_per_frame: int, sample_rate: int) -> Optional[int]:
+    """The duration from a VBRI header at data[offset:], or None if there is no valid one."""
+    # "VBRI", version, delay, quality, bytes, frames, then the TOC layout: entries, scale, entry size, frames per entry
+    header = data[offset:offset + 26]
+    if len(header) != 26 or not header.startswith(b'VBRI') or int.from_bytes(header[4:6], 'big') != 1:
+        return None
+    toc_entries, toc_entry_size = int.from_bytes(header[18:20], 'big'), int.from_bytes(header[22:24], 'big')
+    # mutagen rejects truncated headers and odd TOCs, and then estimates the duration from the bitrate
+    if toc_entry_size not in (2, 4) or len(data) < offset + 26 + toc_entries * toc_entry_size:
+        return None
+    frames = int.from_bytes(header[14:18], 'big')
+    return int(float(frames * samples_per_frame) / sample_rate * 1000)
+
+
+def fast_mp3_duration_ms(mp3_path: str) -> Optional[int]:
+    """
+    Get the duration of an MP3 file from its Xing/Info or VBRI header, in milliseconds.
+
+    Only the first frame is read: the ID3v2 tag (which may hold large cover art) is skipped
+    by its size, without parsing it. Returns None if the file has no such header; raises
+    OSError if it can't be read.
+    """
+    with open(mp3_path, 'rb') as f:
+        f.seek(id3v2_tag_size(f.read(10)))
+        return vbr_header_duration_in_ms(f.read(4096))
+
+
 def get_mp3_duration_in_ms(mp3_path: str) -> int:
     """
     Returns the playback duration of an MP3 file in milliseconds.
 
-    This function reads the MP3 file header and extracts duration information
-    using the `mutagen` library. It raises descriptive exceptions for common
-    failure cases such as missing files, incorrect file types, or unreadable files.
+    This function reads the MP3 file header and takes the duration from its
+    Xing/Info or VBRI header if there is one; otherwise it falls back to the `mutagen`
+    library. It raises descriptive exceptions for common failure cases such as
+    missing files, incorrect file types, or unreadable files.
 
     Parameters:
         mp3_path (str): The absolute or relative path to the MP3 file.
@@ -229,6 +575,10 @@ def get_mp3_duration_in_ms(mp3_path: str) -> int:
         raise ValueError(f"The file '{mp3_path}' is not an MP3 file.")
 
     try:
+        duration_ms = fast_mp3_duration_ms(mp3_path)
+        if duration_ms is not None:
+            return duration_ms
+
         audio = MP3(mp3_path)
         duration_seconds = audio.info.length
         duration_ms = int(duration_seconds * 1000)
@@ -237,3 +587,54 @@ def get_mp3_duration_in_ms(mp3_path: str) -> int:
         raise RuntimeError(f"Failed to read MP3 metadata for '{mp3_path}': {e}")
     except Exception as e:
         raise RuntimeError(f"An unexpected error occurred while processing '{mp3_path}': {e}")
+
+
+DURATION_CACHE_FILE_NAME = '.mp3durcache'
+
+_duration_cache: Optional[shelve.Shelf] = None
+_duration_cache_lock = threading.Lock()
+
+
+def open_duration_cache(cache_path: str = DURATION_CACHE_FILE_NAME) -> None:
+    """
+    Open the shelf that get_mp3_duration_in_ms_cached keeps the durations in (shelve adds its
+    own suffixes to cache_path). Without this call, it is opened in the working directory.
+    """
+    global _duration_cache
+    with _duration_cache_lock:
+        if _duration_cache is None:
+            _duration_cache = shelve.open(cache_path)
+
+
+def get_mp3_duration_in_ms_cached(mp3_path: str) -> int:
+    """
+    Same as get_mp3_duration_in_ms, but memoized on disk across runs.
+
+    The durations are kept in a shelf (see open_duration_cache)
+    keyed by the file's real path, mtime and size, so a file that hasn't changed
+    since the previous run costs a stat() instead of a parse. Failures are not cached.
+    Safe to call from several threads; call close_duration_cache() when done.
+    """
+    global _duration_cache
+    st = os.stat(mp3_path)
+    key = f"{os.path.realpath(mp3_path)}:{st.st_mtime_ns}:{st.st_size}"
+    with _duration_cache_lock:
+        if _duration_cache is None:
+            _duration_cache = shelve.open(DURATION_CACHE_FILE_NAME)
+        duration_ms = _duration_cache.get(key)
+    if duration_ms is not None:
+        return duration_ms
+
+    duration_ms = get_mp3_duration_in_ms(mp3_path)
+    with _duration_cache_lock:
+        _duration_cache[key] = duration_ms
+    return duration_ms
+
+
+def close_duration_cache() -> None:
+    """Write the duration cache to disk and close it (no-op if it was never opened)."""
+    global _duration_cache
+    with _duration_cache_lock:
+        if _duration_cache is not None:
+            _duration_cache.close()
+            _duration_cache = None
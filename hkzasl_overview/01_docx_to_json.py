@@ -1,24 +1,62 @@
 #! /usr/bin/env python
-from docx import Document
 import re
 import json
+import zipfile
 from unicodedata import normalize
 
+from lxml import etree
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# "<author> - <book>", with a hyphen, en dash or em dash; the author ends at the first dash
+BOOK_PATTERN = re.compile(r'^\s*(.+?)\s*[-–—]\s*(.+)$')
+DASHES = '-–—'
+
+
+def iter_paragraph_texts(docx_path):
+    """
+    Yield the text of each top-level paragraph of a .docx file, as python-docx's
+    Document(docx_path).paragraphs would give it, without building the document tree:
+    word/document.xml is streamed and every paragraph is dropped once its text is out.
+    """
+    with zipfile.ZipFile(docx_path) as docx_zip, docx_zip.open('word/document.xml') as xml:
+        for _, p in etree.iterparse(xml, events=('end',), tag=W + 'p'):
+            body = p.getparent()
+            if body.tag != W + 'body':
+                # a paragraph in a table or text box; python-docx doesn't list those either
+                continue
+            text = []
+            for child in p.iterchildren(W + 'r', W + 'hyperlink'):
+                runs = child.iterchildren(W + 'r') if child.tag == W + 'hyperlink' else (child,)
+                for run in runs:
+                    for item in run.iterchildren(W + 't', W + 'tab', W + 'br', W + 'cr'):
+                        if item.tag == W + 't':
+                            text.append(item.text or '')
+                        elif item.tag == W + 'tab':
+                            text.append('\t')
+                        elif item.get(W + 'type') in (None, 'textWrapping'):
+                            # w:cr, or a line break (page and column breaks add no text)
+                            text.append('\n')
+            yield ''.join(text)
+            # Free this paragraph and everything before it (including finished tables)
+            p.clear()
+            while p.getprevious() is not None:
+                del body[0]
+
+
 def parse_authors_books_from_docx(docx_path):
 
-    doc = Document(docx_path)
     authors = []
     current_author = None
     current_books = []
 
     # State tracking
     in_book_list = False
-    book_pattern = re.compile(r'^\s*(.+?)\s*[-–—]\s*(.+)$')
 
-    for para in doc.paragraphs:
+    for para_text in iter_paragraph_texts(docx_path):
         # Normalize and clean the text
-        line = normalize('NFKC', para.text.strip())
-        line = re.sub(r'\s+', ' ', line)
+        line = normalize('NFKC', para_text.strip())
+        line = ' '.join(line.split())
 
         # Detect when we enter the book list section
         if line == "LIJEPA KNJIŽEVNOST" or line.startswith("POGLAVLJA"):
@@ -33,19 +71,25 @@ def parse_authors_books_from_docx(docx_path):
         if len(line) <= 1 or not line:
             continue
 
-        # Try to match author - book pattern
-        match = book_pattern.match(line)
-        if match:
+        # Try to match author - book pattern. Most lines split on their only " - ", which needs
+        # no regex; that is the split BOOK_PATTERN makes too, as long as no dash comes before it.
+        head, separator, tail = line.partition(' - ')
+        if separator and not any(dash in head[1:] for dash in DASHES):
+            author, book = head.strip(), tail.strip()
+        else:
+            match = BOOK_PATTERN.match(line)
+            if not match:
+                continue
             author = match.group(1).strip()
             book = match.group(2).strip()
 
-            # Handle author change
-            if current_author and author != current_author:
-                authors.append({"name": current_author, "books": current_books})
-                current_books = []
+        # Handle author change
+        if current_author and author != current_author:
+            authors.append({"name": current_author, "books": current_books})
+            current_books = []
 
-            current_author = author
-            current_books.append(book)
+        current_author = author
+        current_books.append(book)
 
     # Add the last author
     if current_author and current_books:
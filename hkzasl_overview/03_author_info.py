@@ -1,57 +1,76 @@
 #! /usr/bin/env python
+import argparse
 import json
-import time
-from olclient import OpenLibrary
+import asyncio
+import shelve
 
-def get_author_info(ol: OpenLibrary, name: str):
-    """
-    Use OpenLibrary client to retrieve author metadata.
-    Returns a dictionary with birth_year, death_year, country, genres.
-    """
-    result = {
+import aiohttp
+
+# OpenLibrary lookups are kept here across runs (shelve adds its own file suffixes)
+AUTHOR_CACHE_FILE = "authors_cache"
+AUTHOR_SEARCH_URL = "https://openlibrary.org/search/authors.json"
+# OpenLibrary asks clients to keep the request rate low
+MAX_CONCURRENT_REQUESTS = 5
+REQUEST_INTERVAL = 1.0
+
+
+def empty_author_info():
+    return {
         "birth_year": None,
         "death_year": None,
         "country": None,
         "genres": []
     }
 
-    try:
-        authors = ol.Author.search(name)
-        if not authors:
-            print(f"No results for author: {name}")
-            return result
-
-        author = authors[0]
-        result["birth_year"] = getattr(author, "birth_date", None)
-        result["death_year"] = getattr(author, "death_date", None)
-
-        # Try to extract country from location or bio
-        location = getattr(author, "location", None)
-        if isinstance(location, list):
-            result["country"] = location[0]
-        elif isinstance(location, str):
-            result["country"] = location
-
-        bio = getattr(author, "bio", None)
-        if isinstance(bio, dict):
-            bio = bio.get("value", "")
-        if isinstance(bio, str) and not result["country"]:
-            for country in ["USA", "United Kingdom", "Italy", "France", "Germany", "Spain", "Serbia", "Croatia", "Bosnia"]:
-                if country.lower() in bio.lower():
-                    result["country"] = country
-                    break
-
-        # Genres/subjects aren't well structured in openlibrary-client for authors, so this may stay empty
-        if hasattr(author, "subject"):
-            result["genres"] = author.subject[:5]
 
-    except Exception as e:
-        print(f"Error fetching data for {name}: {e}")
+async def get_author_info(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, name: str):
+    """
+    Query the OpenLibrary author search API for the given name.
+    Returns a dictionary with birth_year, death_year, country, genres,
+    or None if the lookup failed.
+    """
+    result = empty_author_info()
+
+    async with semaphore:
+        try:
+            async with session.get(AUTHOR_SEARCH_URL, params={"q": name}) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Error fetching data for {name}: {e}")
+            return None
+        finally:
+            # Hold the slot a little longer, so that at most MAX_CONCURRENT_REQUESTS
+            # requests are sent to OpenLibrary per REQUEST_INTERVAL
+            await asyncio.sleep(REQUEST_INTERVAL)
+
+    authors = data.get("docs") or []
+    if not authors:
+        print(f"No results for author: {name}")
+        return result
+
+    author = authors[0]
+    result["birth_year"] = author.get("birth_date")
+    result["death_year"] = author.get("death_date")
+    # The search results carry no location or bio, so the country stays empty
+    result["genres"] = (author.get("top_subjects") or [])[:5]
 
     return result
 
 
+async def get_authors_info(names: list):
+    """Look up all names concurrently; the results come back in the order of names."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        return await asyncio.gather(*(get_author_info(session, semaphore, name) for name in names))
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Add OpenLibrary author metadata to the parsed authors list.")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Look up every author again instead of using the results cached by earlier runs")
+    args = parser.parse_args()
+
     input_file = "test.json"
     output_file = "authors.json"
 
@@ -62,19 +81,30 @@ def main():
         print(f"Error loading input: {e}")
         return
 
-    ol = OpenLibrary()
     enriched_authors = []
 
-    for author in authors_data:
-        name = author["name"]
-        print(f"Processing: {name}")
-        info = get_author_info(ol, name)
-        enriched_authors.append({
-            "name": name,
-            "books": author["books"],
-            **info
-        })
-        time.sleep(1)  # Optional rate limit
+    with shelve.open(AUTHOR_CACHE_FILE) as cache:
+        cache_keys = [' '.join(author["name"].lower().split()) for author in authors_data]
+        infos = [None if args.refresh else cache.get(key) for key in cache_keys]
+
+        missing = [i for i, info in enumerate(infos) if info is None]
+        if missing:
+            print(f"Looking up {len(missing)} of {len(authors_data)} authors in OpenLibrary")
+            fetched = asyncio.run(get_authors_info([authors_data[i]["name"] for i in missing]))
+            for i, info in zip(missing, fetched):
+                if info is None:
+                    # Failed lookups are not cached, so the next run tries again
+                    info = empty_author_info()
+                else:
+                    cache[cache_keys[i]] = info
+                infos[i] = info
+
+        for author, info in zip(authors_data, infos):
+            enriched_authors.append({
+                "name": author["name"],
+                "books": author["books"],
+                **info
+            })
 
     try:
         with open(output_file, "w", encoding="utf-8") as f: